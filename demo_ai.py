@@ -3,6 +3,9 @@ import urllib3
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Reused across calls so repeated questions skip the TCP/TLS handshake
+session = requests.Session()
+
 def ask_openai_raw(api_key: str, question: str, model: str = "gpt-4o") -> str:
     url = "https://api.openai.com/v1/chat/completions"
     headers = {
@@ -16,7 +19,7 @@ def ask_openai_raw(api_key: str, question: str, model: str = "gpt-4o") -> str:
             {"role": "user", "content": question}
         ]
     }
-    response = requests.post(url, headers=headers, json=json_data, verify=False)
+    response = session.post(url, headers=headers, json=json_data, verify=False)
     if response.status_code == 200:
         return response.json()["choices"][0]["message"]["content"].strip()
     else:
@@ -1,207 +1,980 @@
 import streamlit as st
-import requests
-import openai
-from bs4 import BeautifulSoup
-from io import BytesIO
-from fpdf import FPDF
-import google.generativeai as genai
-import hashlib
 import json
+import random
+import threading
 import time
+import weakref
+from collections import OrderedDict, deque
 from datetime import datetime
 import re
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+import orjson
+import xxhash
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# openai, google.genai, httpx, lxml, tiktoken and markdown_it are imported inside the functions
+# that use them so the first paint doesn't wait on imports that are only needed once a job is loaded
 
 # --- Streamlit Setup ---
 st.set_page_config(layout="wide", page_title="AI Resume & Cold Email Generator")
 
+# Gemini model used for every call when a non-OpenAI key is entered
+GEMINI_MODEL = "models/gemini-2.0-flash"
+# Cheaper, faster OpenAI model for structured extraction; the sidebar model is kept for generation
+EXTRACTION_MODEL = "gpt-4o-mini"
+# Embedding models for the semantic cache
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+GEMINI_EMBEDDING_MODEL = "models/text-embedding-004"
+
+# System prompts are kept byte-identical across calls (no interpolation) so providers can
+# reuse the cached prompt prefix; only the user message carries per-call data
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant."
+
+SUMMARY_SYSTEM_PROMPT = """You are an AI assistant that extracts structured information from LinkedIn job pages.
+
+You will receive the text of one or more job pages, each starting with a "---JOB k---" marker.
+Extract the job information and any HR/recruiter or hiring manager contact details from each page.
+
+Respond with ONLY a JSON object of this form, with exactly one entry per job, in the same order:
+{"jobs": [{"title": "<exact title>", "company": "<company name>", "location": "<location if available>", "employment_type": "<full-time/part-time/contract if mentioned>", "hr_contact": "<name of the HR contact, recruiter or hiring manager>", "hr_email": "<contact email>", "hr_title": "<their title/role>", "additional_contact_info": "<any other relevant contact details>"}]}
+
+Use an empty string for any field that is not mentioned."""
+
+RESUME_SYSTEM_PROMPT = """You are an expert resume writer and career coach. Create a highly tailored, professional resume based on the job requirements and candidate profile you are given.
+
+INSTRUCTIONS:
+1. Create a compelling, well-structured resume in markdown format
+2. Tailor content specifically to match the job requirements
+3. Follow the customization requirements for style, length, focus areas and keyword usage
+4. Use strong action verbs and quantify achievements where possible
+5. Format it cleanly with headers
+
+Provide a complete, ready-to-use resume that will help this candidate stand out for this specific role."""
+
+EMAIL_SYSTEM_PROMPT = """You are an expert career coach and cold email specialist. Create a compelling, personalized cold email for the job opportunity and candidate you are given.
+
+INSTRUCTIONS:
+1. Create a compelling cold email that stands out
+2. Address it to the appropriate person (use the HR/contact information or a generic "Hiring Manager")
+3. Make it personal and specific to this company and role
+4. Highlight relevant achievements and value proposition
+5. Follow the email requirements for tone, length, resume mention and meeting request
+6. Include a clear call-to-action
+7. Make the subject line compelling and specific
+
+Format:
+Subject: [Compelling subject line]
+
+[Email body]
+
+[Signature exactly as given]"""
+
+# Upper bound on job pages fetched at the same time
+MAX_CONCURRENT_JOBS = 10
+# Headers sent with every job page request
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept-Encoding": "gzip, deflate, br",
+}
+# Job page fetches are retried on rate limits and transient server errors
+FETCH_ATTEMPTS = 3
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Starting request rate per provider: OpenAI tier 1 and the Gemini free tier
+DEFAULT_REQUESTS_PER_MINUTE = {"openai": 500, "gemini": 15}
+# Job page elements that never hold job details
+NON_CONTENT_TAGS = ("script", "style", "noscript", "svg", "nav", "header", "footer")
+# Tokens of job page text kept per job (the most any prompt uses)
+JOB_TEXT_TOKENS = 1500
+# Number of job pages summarized together in one AI call
+SUMMARY_BATCH_SIZE = 5
+# Bounds for the in-memory caches (the completion cache on disk holds up to 500 entries)
+MAX_CACHED_HTML_FILES = 20
+MAX_LOADED_JOBS = 20
+MAX_CACHED_GENERATIONS = 100
+MAX_CACHED_SUMMARIES = 500
+# Only the newest history entries are kept; their resume/email bodies live on disk in a private per-session directory
+MAX_HISTORY_ENTRIES = 50
+HISTORY_DIR_PREFIX = "ai_resume_generator_history_"
+# Fetched and summarized jobs are kept on disk per link for a day
+JOB_STORE_DIR = Path(tempfile.gettempdir()) / "ai_resume_generator_jobs"
+JOB_STORE_TTL = 24 * 60 * 60
+# Cosine similarity above which a previous generation is reused for a new prompt
+SEMANTIC_CACHE_THRESHOLD = 0.95
+MAX_SEMANTIC_CACHE_ENTRIES = 50
+
+# Job info fields holding HR/recruiter contact details
+HR_FIELDS = ("hr_contact", "hr_email", "hr_title", "additional_contact_info")
+
+# Field names accepted by the line-based fallback parser for job summaries
+SUMMARY_FIELD_ALIASES = {
+    "title": "title", "job_title": "title", "company": "company", "company_name": "company",
+    "location": "location", "employment_type": "employment_type", "hr_contact": "hr_contact",
+    "hr_email": "hr_email", "email": "hr_email", "hr_title": "hr_title",
+    "additional_contact_info": "additional_contact_info", "additional_info": "additional_contact_info",
+}
+
+# Regexes compiled once at import instead of being looked up on every call
+JOB_LINK_RE = re.compile(rb'linkedin\.com/jobs/view/(\d+)')
+SUBJECT_RE = re.compile(r'Subject:\s*(.+)')
+# Words of two or more characters in case-folded text, keeping tech tokens like c++, c#, node.js and ci-cd
+# intact; the one-letter languages C and R are the only single letters kept
+WORD_RE = re.compile(r'[a-z][a-z0-9+#]*(?:[.-][a-z0-9+#]+)+|[a-z][a-z0-9+#]+|\b[cr]\b')
+
+# Common words left out of the resume keyword analysis
+STOPWORDS = frozenset(
+    "a about after all also an and any are as at be been but by can do for from has have how i if in into is it "
+    "its more most must not of on or other our out over so such than that the their them then there these they "
+    "this to under up us was we were what when where which while who will with within would you your "
+    # contraction tails split off by WORD_RE (we'll, they're, I've)
+    "ll re ve".split()
+)
+
 # Initialize session state
 if 'job_cache' not in st.session_state:
     st.session_state.job_cache = {}
 if 'resume_history' not in st.session_state:
-    st.session_state.resume_history = []
+    st.session_state.resume_history = deque(maxlen=MAX_HISTORY_ENTRIES)
 if 'email_history' not in st.session_state:
-    st.session_state.email_history = []
+    st.session_state.email_history = deque(maxlen=MAX_HISTORY_ENTRIES)
+if 'history_dir' not in st.session_state:
+    # mkdtemp creates the directory with mode 0o700, so other local users can't read the generated PII
+    st.session_state.history_dir = Path(tempfile.mkdtemp(prefix=HISTORY_DIR_PREFIX))
+    # Delete the bodies once the session is dropped and its state garbage-collected (or on shutdown)
+    weakref.finalize(st.session_state.resume_history, shutil.rmtree, st.session_state.history_dir, True)
+if 'pending_batches' not in st.session_state:
+    st.session_state.pending_batches = {}
+if 'loaded_jobs' not in st.session_state:
+    st.session_state.loaded_jobs = {}
+if 'semantic_cache' not in st.session_state:
+    st.session_state.semantic_cache = {}
 
 # Sidebar for API key input and settings
 st.sidebar.title("⚙️ Settings")
 api_key_input = st.sidebar.text_input("Enter your OpenAI or Gemini API Key", type="password")
+# Provider is decided once per run from the key instead of re-checking the prefix on every call
+use_openai = api_key_input.startswith("sk-")
 
 # Advanced settings
 st.sidebar.subheader("Advanced Options")
 use_cache = st.sidebar.checkbox("Use AI Response Caching", value=True, help="Cache AI responses to speed up re-processing")
+use_semantic_cache = st.sidebar.checkbox("Reuse near-identical generations", value=False, disabled=not use_cache,
+                                         help="Return a cached resume/email when the new prompt is almost the same as a previous one (costs one embedding call per generation)")
 max_jobs_to_process = st.sidebar.slider("Max jobs to process", 1, 20, 10, help="Limit number of jobs to process from HTML")
 ai_model_choice = st.sidebar.selectbox("AI Model (if OpenAI)", ["gpt-4", "gpt-3.5-turbo"], help="Choose AI model for processing")
+ai_requests_per_minute = st.sidebar.slider("Max AI requests per minute", 5, 1000,
+                                           DEFAULT_REQUESTS_PER_MINUTE["openai" if use_openai else "gemini"], step=5,
+                                           help="Throttle AI calls to your provider's rate limit tier (e.g. 15 for Gemini free, 500 for OpenAI tier 1)")
+use_batch_mode = st.sidebar.checkbox("Batch mode (50% cheaper, up to 24h)", value=False,
+                                     help="OpenAI keys only: summarize uploaded jobs through the Batch API and collect the results later")
 
 if not api_key_input:
     st.warning("⚠️ Please enter your API Key in the sidebar to continue.")
     st.stop()
 
 # Helper functions
-@st.cache_data
-def generate_cache_key(text):
-    """Generate a hash key for caching AI responses"""
-    return hashlib.md5(text.encode()).hexdigest()
-
-def get_cached_response(cache_key, cache_type="job_summary"):
-    """Get cached AI response"""
-    if not use_cache:
+@st.cache_resource
+def get_http_client():
+    """Shared HTTP/2 client so LinkedIn fetches multiplex over pooled keep-alive connections"""
+    import httpx
+    # retries only covers failed connects; retryable status codes are handled in fetch_job_text
+    transport = httpx.HTTPTransport(http2=True, retries=3,
+                                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=20))
+    return httpx.Client(transport=transport, follow_redirects=True, timeout=httpx.Timeout(15, connect=5),
+                        headers=HEADERS)
+
+@st.cache_resource
+def get_token_encoding():
+    """Tokenizer used by gpt-4o / gpt-4o-mini, loaded once per process (None if unavailable)"""
+    import tiktoken
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # The BPE file is downloaded on first use; offline hosts fall back to a character estimate
         return None
-    cache_key_full = f"{cache_type}_{cache_key}"
-    return st.session_state.job_cache.get(cache_key_full)
 
-def set_cached_response(cache_key, response, cache_type="job_summary"):
-    """Store AI response in cache"""
-    if use_cache:
-        cache_key_full = f"{cache_type}_{cache_key}"
-        st.session_state.job_cache[cache_key_full] = {
-            'response': response,
-            'timestamp': datetime.now().isoformat()
-        }
+def truncate_tokens(text, max_tokens):
+    """Truncate text to at most max_tokens tokens"""
+    encoding = get_token_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+@st.cache_resource
+def get_markdown_parser():
+    """CommonMark parser, built once per process"""
+    from markdown_it import MarkdownIt
+    return MarkdownIt("commonmark")
+
+def strip_markdown(text):
+    """Convert markdown to plain text, keeping list bullets and line breaks but no other markup"""
+    lines = []
+    lists = []
+    bullet = ""
+    for token in get_markdown_parser().parse(text):
+        if token.type in ("bullet_list_open", "ordered_list_open"):
+            lists.append(token.type)
+        elif token.type in ("bullet_list_close", "ordered_list_close"):
+            lists.pop()
+            if not lists:
+                lines.append("")
+        elif token.type == "list_item_open":
+            indent = "  " * (len(lists) - 1)
+            bullet = indent + (f"{token.info}{token.markup} " if lists[-1] == "ordered_list_open" else "- ")
+        elif token.type == "inline":
+            parts = ("\n" if child.type in ("softbreak", "hardbreak") else child.content for child in token.children)
+            lines.append(bullet + "".join(parts))
+            bullet = ""
+        elif token.type in ("fence", "code_block"):
+            lines.append(token.content.rstrip("\n"))
+            if not lists:
+                lines.append("")
+        elif token.type in ("paragraph_close", "heading_close") and not lists:
+            lines.append("")
+    return "\n".join(lines).strip()
+
+def keyword_set(text):
+    """Distinct meaningful words of a text, case-folded and without punctuation or stopwords"""
+    return frozenset(WORD_RE.findall(text.casefold())) - STOPWORDS
+
+def strip_page_chrome(page_text):
+    """Drop the short navigation lines (Sign in, Jobs, People...) before the first real sentence"""
+    lines = page_text.splitlines()
+    start = next((i for i, line in enumerate(lines) if len(line.split()) >= 3), 0)
+    return "\n".join(lines[start:])
+
+def generate_cache_key(data):
+    """Generate a hash key for caching AI responses or uploaded files (str or bytes)"""
+    return xxhash.xxh3_64_hexdigest(data.encode() if isinstance(data, str) else data)
+
+@st.cache_resource
+def get_generation_cache():
+    """Process-wide LRU of streamed generations (insertion-ordered dict), shared across sessions"""
+    return OrderedDict()
+
+@st.cache_resource
+def get_summary_cache():
+    """Process-wide LRU of per-job summaries keyed by page text, so known pages skip the batch call"""
+    return OrderedDict()
+
+def summary_cache_key(page_text):
+    """Cache key for one job page's summary under the current extraction model and prompt"""
+    model = EXTRACTION_MODEL if use_openai else GEMINI_MODEL
+    return generate_cache_key(f"{model}\n{SUMMARY_SYSTEM_PROMPT}\n{page_text}")
+
+def cache_uploaded_jobs(html_hash, job_data_list):
+    """Remember the processed job list for an uploaded HTML file, evicting the oldest files"""
+    st.session_state.job_cache[f"html_jobs_{html_hash}"] = {
+        'response': job_data_list,
+        'timestamp': datetime.now().isoformat()
+    }
+    while len(st.session_state.job_cache) > MAX_CACHED_HTML_FILES:
+        st.session_state.job_cache.pop(next(iter(st.session_state.job_cache)))
+
+def remember_loaded_job(job_url, job_info):
+    """Keep a job loaded from a pasted link for later reruns, evicting the oldest links"""
+    st.session_state.loaded_jobs[job_url] = job_info
+    while len(st.session_state.loaded_jobs) > MAX_LOADED_JOBS:
+        st.session_state.loaded_jobs.pop(next(iter(st.session_state.loaded_jobs)))
+
+def job_store_path(link):
+    """Disk location of a job link's stored page text and summary under the current extraction model and prompt"""
+    model = EXTRACTION_MODEL if use_openai else GEMINI_MODEL
+    key = generate_cache_key(f"{model}\n{SUMMARY_SYSTEM_PROMPT}\n{link}")
+    return JOB_STORE_DIR / f"{key}.json"
+
+def load_stored_job(link):
+    """Page text and summary stored for a job link within JOB_STORE_TTL (None if missing or stale)"""
+    path = job_store_path(link)
+    try:
+        if time.time() - path.stat().st_mtime > JOB_STORE_TTL:
+            return None
+        return orjson.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+def store_job(link, page_text, summary):
+    """Write a job link's page text and summary to disk"""
+    JOB_STORE_DIR.mkdir(exist_ok=True)
+    job_store_path(link).write_bytes(orjson.dumps({'page_text': page_text, 'summary': summary}))
+
+def store_job_contacts(link, contacts):
+    """Add HR contacts extracted after loading to a job's stored summary, so later sessions skip the extra call"""
+    stored = load_stored_job(link)
+    if stored:
+        store_job(link, stored['page_text'], {**stored['summary'], **contacts, 'hr_checked': True})
+
+def save_history_text(text, suffix):
+    """Write a generated resume/email to a content-addressed file in the session's history directory and return its path"""
+    history_dir = st.session_state.history_dir
+    history_dir.mkdir(mode=0o700, exist_ok=True)
+    path = history_dir / f"{generate_cache_key(text)}{suffix}"
+    if not path.exists():
+        path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def append_history(history, entry, path_field):
+    """Append a history entry, deleting the body file of the entry it evicts unless a kept entry shares it"""
+    evicted = history[0][path_field] if len(history) == history.maxlen else None
+    history.append(entry)
+    if evicted and all(item[path_field] != evicted for item in history):
+        Path(evicted).unlink(missing_ok=True)
+
+def load_history_text(path):
+    """Read a history entry's body back from disk (None if the file has been cleaned up)"""
+    try:
+        return Path(path).read_text(encoding="utf-8")
+    except OSError:
+        return None
+
+@st.cache_resource
+def get_openai_client(api_key):
+    """OpenAI client per API key, reused across reruns so its connection pool is kept"""
+    import openai
+    return openai.OpenAI(api_key=api_key)
+
+@st.cache_resource
+def get_gemini_client(api_key):
+    """Gemini client per API key; the key lives on the client, not in process-wide genai config"""
+    from google import genai
+    return genai.Client(api_key=api_key)
+
+def gemini_config(system, json_mode=False):
+    """Per-call Gemini generation config carrying the system prompt"""
+    config = {"system_instruction": system}
+    if json_mode:
+        config["response_mime_type"] = "application/json"
+    return config
+
+def embed_text(text):
+    """L2-normalized embedding of a prompt for the semantic cache (None if the call fails)"""
+    text = truncate_tokens(text, 2000)
+    # Embedding calls spend the same API quota, so they go through the shared rate limiter too
+    get_rate_limiter(api_key_input, ai_requests_per_minute).acquire()
+    try:
+        if use_openai:
+            response = get_openai_client(api_key_input).embeddings.create(model=OPENAI_EMBEDDING_MODEL, input=text)
+            vector = response.data[0].embedding
+        else:
+            response = get_gemini_client(api_key_input).models.embed_content(model=GEMINI_EMBEDDING_MODEL, contents=text)
+            vector = response.embeddings[0].values
+    except Exception:
+        return None
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
 
-def call_ai_api(prompt, model_type="summary"):
-    """Unified AI API calling function with caching"""
-    cache_key = generate_cache_key(prompt)
-    cached = get_cached_response(cache_key, model_type)
+def semantic_cache_lookup(cache_name, vector):
+    """Return the cached response whose prompt embedding is closest to vector, if it is close enough"""
+    entry = st.session_state.semantic_cache.get(cache_name)
+    if not entry:
+        return None
+    similarities = entry['vectors'] @ vector
+    best = int(np.argmax(similarities))
+    return entry['responses'][best] if similarities[best] >= SEMANTIC_CACHE_THRESHOLD else None
+
+def semantic_cache_store(cache_name, vector, response):
+    """Add a response to the semantic cache, keeping only the most recent entries"""
+    entry = st.session_state.semantic_cache.setdefault(
+        cache_name, {'vectors': np.empty((0, vector.size), dtype=np.float32), 'responses': []})
+    entry['vectors'] = np.vstack([entry['vectors'], vector])[-MAX_SEMANTIC_CACHE_ENTRIES:]
+    entry['responses'] = (entry['responses'] + [response])[-MAX_SEMANTIC_CACHE_ENTRIES:]
+
+def chat_messages(prompt, system=DEFAULT_SYSTEM_PROMPT):
+    """Build the OpenAI chat messages for a prompt"""
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt}
+    ]
+
+class RateLimiter:
+    """Thread-safe token bucket allowing ``rate`` acquisitions per ``period`` seconds"""
     
-    if cached:
-        st.sidebar.success(f"✅ Using cached {model_type} response")
-        return cached['response']
+    def __init__(self, rate, period=60):
+        self.capacity = rate
+        self.tokens = float(rate)
+        self.fill_rate = rate / period
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+@st.cache_resource
+def get_rate_limiter(api_key, requests_per_minute):
+    """Rate limiter shared by every session and worker thread using the same API key"""
+    return RateLimiter(requests_per_minute)
+
+def is_retryable_error(error):
+    """Whether an AI API error is a rate limit, timeout or transient server error"""
+    import openai
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError,
+                          openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    # google.genai APIError exposes the HTTP status as .code
+    return getattr(error, "code", None) in (429, 500, 503)
+
+def send_completion(api_key, model, prompt, json_mode=False, system=DEFAULT_SYSTEM_PROMPT):
+    """Send a prompt to OpenAI (sk- keys) or Gemini and return the response text"""
+    if api_key.startswith("sk-"):
+        client = get_openai_client(api_key)
+        response = client.chat.completions.create(
+            model=model,
+            messages=chat_messages(prompt, system),
+            **({"response_format": {"type": "json_object"}} if json_mode else {})
+        )
+        return response.choices[0].message.content
+    
+    response = get_gemini_client(api_key).models.generate_content(
+        model=model, contents=prompt, config=gemini_config(system, json_mode))
+    return response.text
+
+def request_completion(api_key, model, prompt, json_mode=False, system=DEFAULT_SYSTEM_PROMPT, attempts=3):
+    """Rate-limited send_completion, retried with exponential backoff on 429s and timeouts"""
+    limiter = get_rate_limiter(api_key, ai_requests_per_minute)
+    for attempt in range(attempts):
+        limiter.acquire()
+        try:
+            return send_completion(api_key, model, prompt, json_mode, system)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_retryable_error(e):
+                raise
+            time.sleep(random.uniform(1, min(60, 2 ** (attempt + 2))))
+
+@st.cache_data(max_entries=500, persist="disk", show_spinner=False)
+def cached_completion(api_key, model, prompt, json_mode=False, system=DEFAULT_SYSTEM_PROMPT, model_type="summary"):
+    """Exact-match completion cache, persisted to disk and shared across sessions and restarts"""
+    return request_completion(api_key, model, prompt, json_mode, system)
+
+def call_ai_api(prompt, model_type="summary", model=None, json_mode=False, system=DEFAULT_SYSTEM_PROMPT):
+    """Unified AI API calling function with caching (model overrides the sidebar choice for OpenAI)"""
+    if use_openai:
+        model = model or ai_model_choice
+    else:
+        model = GEMINI_MODEL
     
     try:
-        if api_key_input.startswith("sk-"):
-            openai.api_key = api_key_input
-            response = openai.ChatCompletion.create(
-                model=ai_model_choice,
-                messages=[
-                    {"role": "system", "content": "You are a helpful AI assistant."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            result = response.choices[0].message.content
-        else:
-            genai.configure(api_key=api_key_input)
-            model = genai.GenerativeModel("models/gemini-2.0-flash")
-            response = model.generate_content(prompt)
-            result = response.text
-        
-        set_cached_response(cache_key, result, model_type)
-        return result
+        if use_cache:
+            return cached_completion(api_key_input, model, prompt, json_mode, system, model_type)
+        return request_completion(api_key_input, model, prompt, json_mode, system)
     except Exception as e:
         st.error(f"AI API Error: {str(e)}")
         return None
 
-def extract_linkedin_jobs(html_content):
-    """Extract LinkedIn job links from HTML"""
-    soup = BeautifulSoup(html_content, "html.parser")
-    job_links = []
-    
-    for a in soup.find_all("a", href=True):
-        href = a['href']
-        if "linkedin.com/jobs/view" in href:
-            # Clean up the URL
-            job_id = re.search(r'/jobs/view/(\d+)', href)
-            if job_id:
-                clean_url = f"https://www.linkedin.com/jobs/view/{job_id.group(1)}"
-                job_links.append(clean_url)
-    
-    return list(set(job_links))[:max_jobs_to_process]
-
-def extract_hr_info(job_text):
-    """Extract HR/recruiter information from job description"""
-    hr_prompt = f"""
-Analyze this LinkedIn job posting and extract any HR/recruiter contact information or hiring manager details.
-
-Look for:
-1. HR contact name
-2. Recruiter name
-3. Hiring manager name
-4. Contact email
-5. Any person mentioned as contact for applications
-6. Department head names
-7. Team lead names
-
-Job Text:
-{job_text[:4000]}
-
-Provide the information in this format:
-HR Contact: [Name if found, otherwise "Not specified"]
-Email: [Email if found, otherwise "Not found"]
-Title: [Their title/role if mentioned, otherwise "HR/Recruiter"]
-Additional Info: [Any other relevant contact details]
-
-If no specific contact is found, suggest generic titles like "Hiring Manager" or "HR Team".
-"""
-    
-    return call_ai_api(hr_prompt, "hr_extraction")
-
-def process_job_link(link, index):
-    """Process a single job link and return job info"""
+def stream_ai_api(prompt, model_type="summary", system=DEFAULT_SYSTEM_PROMPT, options=()):
+    """Yield an AI response in chunks as it is generated, caching the full text once done (options must match exactly for a semantic hit)"""
+    generation_cache = get_generation_cache()
+    cache_key = generate_cache_key(f"{model_type}\n{api_key_input}\n{ai_model_choice}\n{system}\n{prompt}")
+    
+    if use_cache and cache_key in generation_cache:
+        generation_cache.move_to_end(cache_key)
+        st.sidebar.success(f"✅ Using cached {model_type} response")
+        yield generation_cache[cache_key]
+        return
+    
+    # Embeddings differ per provider, so each model and prompt type keeps its own vectors; the options
+    # barely move the embedding (or are truncated off it), so each combination gets its own vectors too
+    options_key = generate_cache_key("\n".join(map(str, options)))
+    semantic_name = f"{model_type}_{ai_model_choice if use_openai else GEMINI_MODEL}_{options_key}"
+    vector = embed_text(f"{system}\n{prompt}") if use_cache and use_semantic_cache else None
+    if vector is not None:
+        similar = semantic_cache_lookup(semantic_name, vector)
+        if similar is not None:
+            st.sidebar.success(f"♻️ Using cached {model_type} response for a near-identical prompt")
+            yield similar
+            return
+    
+    # Errors propagate out of the generator so a stream that fails partway is never taken as a full response
+    chunks = []
+    get_rate_limiter(api_key_input, ai_requests_per_minute).acquire()
+    if use_openai:
+        client = get_openai_client(api_key_input)
+        stream = client.chat.completions.create(
+            model=ai_model_choice,
+            messages=chat_messages(prompt, system),
+            stream=True
+        )
+        for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                chunks.append(text)
+                yield text
+    else:
+        stream = get_gemini_client(api_key_input).models.generate_content_stream(
+            model=GEMINI_MODEL, contents=prompt, config=gemini_config(system))
+        for chunk in stream:
+            if chunk.text:
+                chunks.append(chunk.text)
+                yield chunk.text
+    
+    if use_cache:
+        generation_cache[cache_key] = "".join(chunks)
+        while len(generation_cache) > MAX_CACHED_GENERATIONS:
+            generation_cache.popitem(last=False)
+        if vector is not None:
+            semantic_cache_store(semantic_name, vector, generation_cache[cache_key])
+
+def write_ai_stream(prompt, model_type, system, options=()):
+    """Render a streamed AI response and return its full text (None if the stream failed partway)"""
     try:
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
-        response = requests.get(link, headers=headers, timeout=15)
-        response.raise_for_status()
+        return st.write_stream(stream_ai_api(prompt, model_type, system, options))
+    except Exception as e:
+        st.error(f"AI API Error: {str(e)}")
+        return None
+
+@st.cache_data(max_entries=MAX_CACHED_HTML_FILES, show_spinner=False)
+def scan_uploaded_html(file_id, _html_file):
+    """Hash an uploaded HTML file and extract its unique job links (cached per upload; the file isn't hashed)"""
+    html_content = _html_file.getvalue()
+    # One regex scan over the raw bytes; dict.fromkeys de-duplicates while keeping first-seen order
+    job_ids = dict.fromkeys(JOB_LINK_RE.findall(html_content))
+    return generate_cache_key(html_content), [f"https://www.linkedin.com/jobs/view/{job_id.decode()}" for job_id in job_ids]
+
+def format_hr_info(job_info):
+    """HR/recruiter details captured with the job summary, formatted for the email prompt"""
+    return "\n".join([
+        f"HR Contact: {job_info.get('hr_contact') or 'Not specified'}",
+        f"Email: {job_info.get('hr_email') or 'Not found'}",
+        f"Title: {job_info.get('hr_title') or 'HR/Recruiter'}",
+        f"Additional Info: {job_info.get('additional_contact_info') or 'None'}",
+    ])
+
+def visible_text(root):
+    """Newline-separated visible text of an lxml tree, skipping script/style contents"""
+    lines = []
+    for element in root.iter():
+        if isinstance(element.tag, str) and element.tag not in ("script", "style") and element.text:
+            lines.append(element.text.strip())
+        if element.tail:
+            lines.append(element.tail.strip())
+    return "\n".join(line for line in lines if line)
+
+def is_job_posting(item):
+    """Whether a JSON-LD node is a JobPosting (@type may be a string or a list of types)"""
+    types = item.get("@type") if isinstance(item, dict) else None
+    return types == "JobPosting" or isinstance(types, list) and "JobPosting" in types
+
+def job_posting_summary(root):
+    """Title, company, location and employment type from a page's schema.org JobPosting JSON-LD ({} if absent)"""
+    for script in root.iterfind('.//script[@type="application/ld+json"]'):
+        try:
+            data = json.loads(script.text or "")
+        except ValueError:
+            continue
+        items = data if isinstance(data, list) else data.get("@graph", [data]) if isinstance(data, dict) else []
+        posting = next((item for item in items if is_job_posting(item)), None)
+        if not posting or not posting.get("title"):
+            continue
         
-        page_text = BeautifulSoup(response.content, "html.parser").get_text(separator="\n", strip=True)
+        organization = posting.get("hiringOrganization")
+        organization = organization.get("name") if isinstance(organization, dict) else organization
+        location = posting.get("jobLocation")
+        location = (location[0] if location else {}) if isinstance(location, list) else location
+        address = location.get("address") if isinstance(location, dict) else None
+        address = address if isinstance(address, dict) else {}
+        employment_type = posting.get("employmentType") or ""
+        return {
+            "title": posting["title"],
+            "company": organization if isinstance(organization, str) else "",
+            "location": ", ".join(address[key] for key in ("addressLocality", "addressRegion") if isinstance(address.get(key), str)),
+            "employment_type": ", ".join(employment_type) if isinstance(employment_type, list) else employment_type,
+            # Contacts aren't part of JobPosting; they are extracted by AI if an email is requested
+            "hr_checked": False,
+        }
+    return {}
+
+@st.cache_data(ttl=60 * 60, show_spinner=False)
+def fetch_job_text(link, _client):
+    """Download a LinkedIn job page; return its visible text and JSON-LD summary (cached per URL; the client isn't hashed)"""
+    from lxml import etree
+    for attempt in range(FETCH_ATTEMPTS):
+        with _client.stream("GET", link) as response:
+            retry = response.status_code in RETRY_STATUS_CODES and attempt < FETCH_ATTEMPTS - 1
+            if not retry:
+                response.raise_for_status()
+                # Feed the body to lxml as it arrives instead of buffering the whole page first
+                parser = etree.HTMLParser(encoding=response.charset_encoding, remove_comments=True)
+                for chunk in response.iter_bytes(65536):
+                    parser.feed(chunk)
+        if not retry:
+            break
+        # Back off only once the response is closed, so the pooled connection isn't held while sleeping
+        time.sleep(0.3 * 2 ** attempt)
+    root = parser.close()
+    if root is None:
+        return "", {}
+    posting = job_posting_summary(root)
+    # Drop non-content subtrees in C and keep only <main> (the job card and description) when the page has one
+    etree.strip_elements(root, *NON_CONTENT_TAGS, with_tail=False)
+    main = root.find(".//main")
+    # Only as much text as any prompt uses is kept, here and everywhere downstream
+    return truncate_tokens(strip_page_chrome(visible_text(main if main is not None else root)), JOB_TEXT_TOKENS), posting
+
+def parse_json_response(text):
+    """Parse a JSON object from an AI response, ignoring any code fences or prose around it"""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("No JSON object in AI response")
+    return json.loads(text[start:end + 1])
+
+def build_summary_prompt(page_texts):
+    """Build the user prompt (job pages only) for SUMMARY_SYSTEM_PROMPT"""
+    return "\n\n".join(f"---JOB {k+1}---\n{truncate_tokens(text, 800)}" for k, text in enumerate(page_texts))
+
+def parse_key_value_jobs(text):
+    """Fallback parser for "field: value" job summaries, reading every line once"""
+    jobs = [{}]
+    for line in text.splitlines():
+        key, sep, value = line.partition(":")
+        key = SUMMARY_FIELD_ALIASES.get(key.strip(' -*"').casefold().replace(" ", "_"))
+        if not sep or not key:
+            continue
+        # A repeated field means the next job's summary has started
+        if key in jobs[-1]:
+            jobs.append({})
+        jobs[-1][key] = value.strip(' ",')
+    return jobs if jobs[0] else []
+
+def parse_job_summaries(ai_response, count):
+    """Parse a job summary response into exactly ``count`` (possibly empty) dicts"""
+    try:
+        jobs = parse_json_response(ai_response).get("jobs", [])
+    except (ValueError, AttributeError):
+        jobs = parse_key_value_jobs(ai_response)
+        if not jobs:
+            st.warning("⚠️ Could not parse job summaries from the AI response")
+    
+    # Pad so every page gets a (possibly empty) summary
+    jobs = [job if isinstance(job, dict) else {} for job in jobs[:count]]
+    return jobs + [{}] * (count - len(jobs))
+
+def summarize_jobs(page_texts):
+    """Extract title/company/location and HR contacts for several job pages with a single AI call"""
+    ai_response = call_ai_api(build_summary_prompt(page_texts), "job_summary", model=EXTRACTION_MODEL,
+                              json_mode=True, system=SUMMARY_SYSTEM_PROMPT)
+    if not ai_response:
+        return [{}] * len(page_texts)
+    return parse_job_summaries(ai_response, len(page_texts))
+
+def build_job_info(link, index, page_text, summary):
+    """Combine a fetched job page and its AI summary into a job info dict"""
+    title = summary.get("title") or f"Job {index+1}"
+    company = summary.get("company") or "Unknown Company"
+    location = summary.get("location") or ""
+    
+    # Create display name
+    display_parts = [title, company]
+    if location:
+        display_parts.append(location)
+    
+    display_name = " | ".join(display_parts) + f" (#{index+1})"
+    
+    return {
+        'display_name': display_name,
+        'link': link,
+        'title': title,
+        'company': company,
+        'location': location,
+        'hr_contact': summary.get("hr_contact") or "",
+        'hr_email': summary.get("hr_email") or "",
+        'hr_title': summary.get("hr_title") or "",
+        'additional_contact_info': summary.get("additional_contact_info") or "",
+        'hr_checked': summary.get("hr_checked", True),
+        'raw_text': page_text,  # Store for resume generation
+        'raw_keywords': keyword_set(page_text)  # For the resume keyword analysis
+    }
+
+def failed_job_info(link, index):
+    """Placeholder job info for a link whose page could not be loaded"""
+    return {
+        'display_name': f"Job {index+1} - Failed to Load Details",
+        'link': link,
+        'title': f"Job {index+1}",
+        'company': "Unknown",
+        'location': "",
+        'raw_text': "",
+        'raw_keywords': frozenset()
+    }
+
+def fetch_job_page(client, link, index):
+    """Fetch a job page, returning (None, {}) (with a warning) if it cannot be loaded"""
+    try:
+        return fetch_job_text(link, client)
+    except Exception as e:
+        st.warning(f"⚠️ Could not process job {index+1}: {str(e)}")
+        return None, {}
+
+def script_thread_pool(max_workers):
+    """Thread pool whose workers inherit the script context so they can use st.* and session state"""
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=add_script_run_ctx,
+                              initargs=(None, get_script_run_ctx()))
+
+def fetch_job_pages(links, status):
+    """Fetch {index: link} job pages concurrently, relabelling status as they arrive
+
+    Returns ({index: page text or None}, {index: JSON-LD summary}) with only pages that had JSON-LD in the second dict.
+    """
+    page_texts, postings = {}, {}
+    if not links:
+        return page_texts, postings
+    # Resolve the pooled client once and hand it to every worker
+    client = get_http_client()
+    
+    with script_thread_pool(min(MAX_CONCURRENT_JOBS, len(links))) as executor:
+        futures = {executor.submit(fetch_job_page, client, link, i): i for i, link in links.items()}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            page_texts[i], posting = future.result()
+            if posting:
+                postings[i] = posting
+            # Relabel every other page instead of sending a frontend update per page
+            if done % 2 == 0 or done == len(links):
+                status.update(label=f"🔄 Fetched {done}/{len(links)} job pages...")
+    
+    return page_texts, postings
+
+def assemble_job_infos(links, page_texts, summaries):
+    """Build the job info list for fetched pages and their summaries, in link order"""
+    return [
+        build_job_info(link, i, page_texts[i], summaries.get(i, {})) if page_texts[i] else failed_job_info(link, i)
+        for i, link in enumerate(links)
+    ]
+
+def remember_job_summaries(links, fetched, summaries, summarized):
+    """Write AI summaries to the per-job cache and fetched pages with their summaries to the disk job store"""
+    summary_cache = get_summary_cache()
+    # Empty summaries are failed extractions and are retried next time
+    for i in summarized:
+        if summaries.get(i):
+            summary_cache[summary_cache_key(fetched[i])] = summaries[i]
+    while len(summary_cache) > MAX_CACHED_SUMMARIES:
+        summary_cache.popitem(last=False)
+    for i, page_text in fetched.items():
+        if page_text and summaries.get(i):
+            store_job(links[i], page_text, summaries[i])
+
+def process_job_links(links):
+    """Fetch job pages concurrently, then summarize them in batched AI calls"""
+    with st.status(f"🔄 Processing {len(links)} jobs...", expanded=False) as status:
+        # Jobs stored in the last day skip both the page request and the AI call
+        stored = {i: load_stored_job(link) for i, link in enumerate(links)} if use_cache else {}
+        stored = {i: job for i, job in stored.items() if job}
+        page_texts = {i: job['page_text'] for i, job in stored.items()}
+        fetched, postings = fetch_job_pages({i: link for i, link in enumerate(links) if i not in stored}, status)
+        page_texts.update(fetched)
         
-        ai_summary_prompt = f"""
-Extract job information from this LinkedIn job page text. Provide ONLY:
-Job Title: <exact title>
-Company: <company name>
-Location: <location if available>
-Employment Type: <full-time/part-time/contract if mentioned>
-
-Text (first 3000 characters):
-{page_text[:3000]}
-"""
+        # Pages with JobPosting JSON-LD need no AI call; pages summarized before are answered
+        # from the per-job cache; both are left out of the batches
+        summaries = {i: job['summary'] for i, job in stored.items()}
+        summaries.update(postings)
+        summary_cache = get_summary_cache()
+        cache_keys = {i: summary_cache_key(text) for i, text in page_texts.items() if text and i not in summaries}
+        summaries.update({i: summary_cache[key] for i, key in cache_keys.items() if use_cache and key in summary_cache})
         
-        ai_response = call_ai_api(ai_summary_prompt, "job_summary")
-        if not ai_response:
-            return None
-            
-        # Parse AI response
-        lines = ai_response.splitlines()
-        title = next((line.split(":", 1)[1].strip() for line in lines if line.lower().startswith("job title:")), f"Job {index+1}")
-        company = next((line.split(":", 1)[1].strip() for line in lines if line.lower().startswith("company:")), "Unknown Company")
-        location = next((line.split(":", 1)[1].strip() for line in lines if line.lower().startswith("location:")), "")
+        # One AI call per batch of pages instead of one per page
+        pending = [i for i in sorted(cache_keys) if i not in summaries]
+        batches = [pending[start:start + SUMMARY_BATCH_SIZE] for start in range(0, len(pending), SUMMARY_BATCH_SIZE)]
+        if batches:
+            status.update(label=f"🤖 Summarizing {len(pending)} jobs...")
+            # Batches are summarized concurrently; the shared rate limiter keeps them within the provider's limit
+            with script_thread_pool(min(MAX_CONCURRENT_JOBS, len(batches))) as executor:
+                results = executor.map(lambda batch: summarize_jobs([page_texts[i] for i in batch]), batches)
+                for batch, batch_summaries in zip(batches, results):
+                    summaries.update(zip(batch, batch_summaries))
         
-        # Create display name
-        display_parts = [title, company]
-        if location:
-            display_parts.append(location)
+        if use_cache:
+            remember_job_summaries(links, fetched, summaries, pending)
         
-        display_name = " | ".join(display_parts) + f" (#{index+1})"
+        status.update(label=f"✅ Processed {len(links)} jobs", state="complete")
+    return assemble_job_infos(links, page_texts, summaries)
+
+def submit_summary_batch(links, page_texts, postings):
+    """Submit one summary request per loaded job page without JSON-LD to the OpenAI Batch API"""
+    requests_jsonl = "\n".join(
+        json.dumps({
+            "custom_id": link,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": EXTRACTION_MODEL,
+                "messages": chat_messages(build_summary_prompt([page_texts[i]]), SUMMARY_SYSTEM_PROMPT),
+                "response_format": {"type": "json_object"}
+            }
+        })
+        for i, link in enumerate(links) if page_texts[i] and i not in postings
+    )
+    
+    client = get_openai_client(api_key_input)
+    batch_file = client.files.create(file=("job_summaries.jsonl", requests_jsonl.encode()), purpose="batch")
+    batch = client.batches.create(input_file_id=batch_file.id,
+                                  endpoint="/v1/chat/completions",
+                                  completion_window="24h")
+    return batch.id
+
+def collect_summary_batch(batch_id, links, page_texts, postings):
+    """Poll a submitted batch; return (status, job info list once completed)"""
+    client = get_openai_client(api_key_input)
+    batch = client.batches.retrieve(batch_id)
+    if batch.status != "completed":
+        return batch.status, None
+    
+    summaries = dict(postings)
+    summarized = []
+    if batch.output_file_id:
+        link_index = {link: i for i, link in enumerate(links)}
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            result = json.loads(line)
+            body = (result.get("response") or {}).get("body") or {}
+            if result.get("custom_id") in link_index and body.get("choices"):
+                content = body["choices"][0]["message"]["content"]
+                summarized.append(link_index[result["custom_id"]])
+                summaries[summarized[-1]] = parse_job_summaries(content, 1)[0]
+    
+    # Written back like process_job_links does, so loading these pages later without batch mode skips the AI call
+    if use_cache:
+        remember_job_summaries(links, page_texts, summaries, summarized)
+    return batch.status, assemble_job_infos(links, page_texts, summaries)
+
+def run_summary_batch(html_hash, links):
+    """Submit or poll the Batch API job for an uploaded HTML file; returns job infos once done"""
+    pending = st.session_state.pending_batches.get(html_hash)
+    
+    if pending and pending.get('job_data_list') is not None:
+        return pending['job_data_list']
+    
+    if pending is None:
+        with st.status(f"🔄 Fetching {len(links)} jobs...", expanded=False) as status:
+            page_texts, postings = fetch_job_pages(dict(enumerate(links)), status)
+            status.update(label=f"✅ Fetched {len(links)} jobs", state="complete")
+        if all(i in postings for i, text in page_texts.items() if text):
+            return assemble_job_infos(links, page_texts, postings)
         
-        return {
-            'display_name': display_name,
-            'link': link,
-            'title': title,
-            'company': company,
-            'location': location,
-            'raw_text': page_text[:8000]  # Store for resume generation
-        }
+        try:
+            batch_id = submit_summary_batch(links, page_texts, postings)
+        except Exception as e:
+            st.error(f"Batch API Error: {str(e)}")
+            return None
         
+        st.session_state.pending_batches[html_hash] = {'batch_id': batch_id, 'links': links,
+                                                       'page_texts': page_texts, 'postings': postings}
+        st.info(f"📨 Submitted batch `{batch_id}`. Results can take up to 24 hours - check back later.")
+        st.button("🔄 Check Batch Status")
+        return None
+    
+    try:
+        status, job_data_list = collect_summary_batch(pending['batch_id'], pending['links'],
+                                                        pending['page_texts'], pending['postings'])
     except Exception as e:
-        st.warning(f"⚠️ Could not process job {index+1}: {str(e)}")
-        return {
-            'display_name': f"Job {index+1} - Failed to Load Details",
-            'link': link,
-            'title': f"Job {index+1}",
-            'company': "Unknown",
-            'location': "",
-            'raw_text': ""
-        }
+        st.error(f"Batch API Error: {str(e)}")
+        return None
+    
+    if job_data_list is not None:
+        # Keep the results so later reruns don't resubmit the batch; the page texts now live in the job infos
+        pending['job_data_list'] = job_data_list
+        del pending['page_texts'], pending['postings']
+        st.success("✅ Batch completed")
+        return job_data_list
+    
+    if status in ("failed", "expired", "cancelling", "cancelled"):
+        del st.session_state.pending_batches[html_hash]
+        st.error(f"❌ Batch `{pending['batch_id']}` {status}. Upload the file again to retry.")
+        return None
+    
+    st.info(f"⏳ Batch `{pending['batch_id']}` is {status.replace('_', ' ')}.")
+    st.button("🔄 Check Batch Status")
+    return None
 
 # --- Main Application ---
 st.title("🚀 AI Resume & Cold Email Generator")
 st.markdown("Generate tailored resumes and cold emails from LinkedIn job descriptions powered by AI")
 
-# Display cache statistics
-if use_cache and st.session_state.job_cache:
-    st.sidebar.info(f"📊 Cache: {len(st.session_state.job_cache)} items stored")
-    if st.sidebar.button("🗑️ Clear Cache"):
+# UI sections wrapped in st.fragment rerun on their own when their widgets change,
+# instead of re-executing the whole script
+@st.fragment
+def render_cache_stats():
+    """Cache statistics and the Clear Cache button (rendered in the sidebar)"""
+    st.info(f"📊 Cache: {len(st.session_state.job_cache)} uploaded files, {len(get_generation_cache())} generations stored")
+    if st.button("🗑️ Clear Cache"):
         st.session_state.job_cache.clear()
+        cached_completion.clear()
+        get_generation_cache().clear()
+        get_summary_cache().clear()
+        shutil.rmtree(JOB_STORE_DIR, ignore_errors=True)
+        st.session_state.semantic_cache.clear()
         st.success("Cache cleared!")
 
+@st.fragment
+def render_history():
+    """Previously generated resumes and emails"""
+    st.header("📚 Generation History")
+    
+    # Create tabs for different history types
+    history_tab1, history_tab2 = st.tabs(["📄 Resume History", "📧 Email History"])
+    
+    with history_tab1:
+        if st.session_state.resume_history:
+            history_options = [f"{item['job_title']} at {item['company']} - {item['timestamp']}" for item in st.session_state.resume_history]
+            selected_history = st.selectbox("Select from previous resumes:", history_options)
+            
+            if selected_history:
+                selected_item = st.session_state.resume_history[history_options.index(selected_history)]
+                previous_resume = load_history_text(selected_item['resume_path'])
+                st.markdown("### Previous Resume")
+                if previous_resume is None:
+                    st.warning("This resume is no longer available.")
+                else:
+                    st.markdown(previous_resume)
+                    
+                    if st.download_button("📥 Download Previous Resume", 
+                                        previous_resume, 
+                                        file_name=f"resume_{selected_item['candidate_name']}.md",
+                                        mime="text/markdown"):
+                        st.success("Resume downloaded!")
+        else:
+            st.info("No resume history found. Generate some resumes first!")
+    
+    with history_tab2:
+        if st.session_state.email_history:
+            email_options = [f"{item['job_title']} at {item['company']} - {item['timestamp']}" for item in st.session_state.email_history]
+            selected_email = st.selectbox("Select from previous emails:", email_options)
+            
+            if selected_email:
+                selected_email_item = st.session_state.email_history[email_options.index(selected_email)]
+                previous_email = load_history_text(selected_email_item['email_path'])
+                st.markdown("### Previous Cold Email")
+                if previous_email is None:
+                    st.warning("This email is no longer available.")
+                else:
+                    st.markdown(previous_email)
+                    
+                    if st.download_button("📥 Download Previous Email", 
+                                        previous_email, 
+                                        file_name=f"cold_email_{selected_email_item['sender_name']}.txt",
+                                        mime="text/plain"):
+                        st.success("Email downloaded!")
+        else:
+            st.info("No email history found. Generate some cold emails first!")
+
+# Display cache statistics
+if use_cache:
+    with st.sidebar:
+        render_cache_stats()
+
 # Source selection
 source_option = st.radio("📥 Choose data source:", ["Upload HTML", "Enter Job Link", "History"])
 
@@ -212,45 +985,28 @@ if source_option == "Upload HTML":
     html_file = st.file_uploader("Upload HTML file containing LinkedIn job links", type=["html", "htm"])
 
     if html_file:
-        html_content = html_file.read()
-        job_links = extract_linkedin_jobs(html_content)
+        html_hash, job_links = scan_uploaded_html(html_file.file_id, html_file)
+        job_links = job_links[:max_jobs_to_process]
         
         if not job_links:
             st.warning("No LinkedIn job links found in the uploaded HTML.")
         else:
             st.info(f"Found {len(job_links)} job links. Processing up to {max_jobs_to_process} jobs...")
             
-            # Generate cache key for this HTML file
-            html_hash = generate_cache_key(str(html_content))
-            
             # Check if we've processed this HTML before
             if f"html_jobs_{html_hash}" in st.session_state.job_cache and use_cache:
                 st.success("✅ Using cached job data for this HTML file")
                 job_data_list = st.session_state.job_cache[f"html_jobs_{html_hash}"]['response']
             else:
                 # Process jobs
-                with st.spinner(f"🔄 Processing {len(job_links)} jobs..."):
-                    progress_bar = st.progress(0)
-                    job_data_list = []
-                    
-                    for i, link in enumerate(job_links):
-                        progress_bar.progress((i + 1) / len(job_links))
-                        st.text(f"Processing job {i+1}/{len(job_links)}...")
-                        
-                        job_info = process_job_link(link, i)
-                        if job_info:
-                            job_data_list.append(job_info)
-                        
-                        time.sleep(0.5)  # Rate limiting
-                    
-                    progress_bar.empty()
-                    
-                    # Cache the processed jobs
-                    if use_cache:
-                        st.session_state.job_cache[f"html_jobs_{html_hash}"] = {
-                            'response': job_data_list,
-                            'timestamp': datetime.now().isoformat()
-                        }
+                if use_batch_mode and use_openai:
+                    job_data_list = run_summary_batch(html_hash, job_links)
+                else:
+                    job_data_list = process_job_links(job_links)
+                
+                # Cache the processed jobs (nothing to cache while a batch is still running)
+                if use_cache and job_data_list is not None:
+                    cache_uploaded_jobs(html_hash, job_data_list)
             
             if job_data_list:
                 job_options = [job['display_name'] for job in job_data_list]
@@ -274,55 +1030,23 @@ elif source_option == "Enter Job Link":
     job_url = st.text_input("Paste LinkedIn job URL here:")
     
     if job_url and "linkedin.com/jobs/view" in job_url:
-        job_info = process_job_link(job_url, 0)
-        if job_info:
+        # Reuse the job loaded on an earlier rerun instead of fetching and summarizing it again on submit
+        job_info = st.session_state.loaded_jobs.get(job_url)
+        if job_info is None:
+            job_info = process_job_links([job_url])[0]
+            if job_info['raw_text']:
+                remember_loaded_job(job_url, job_info)
+        
+        if job_info['raw_text']:
             selected_job_info = job_info
             st.success(f"✅ Job loaded: {job_info['title']} at {job_info['company']}")
 
 elif source_option == "History":
-    st.header("📚 Generation History")
-    
-    # Create tabs for different history types
-    history_tab1, history_tab2 = st.tabs(["📄 Resume History", "📧 Email History"])
-    
-    with history_tab1:
-        if st.session_state.resume_history:
-            history_options = [f"{item['job_title']} at {item['company']} - {item['timestamp']}" for item in st.session_state.resume_history]
-            selected_history = st.selectbox("Select from previous resumes:", history_options)
-            
-            if selected_history:
-                selected_item = st.session_state.resume_history[history_options.index(selected_history)]
-                st.markdown("### Previous Resume")
-                st.markdown(selected_item['resume'])
-                
-                if st.download_button("📥 Download Previous Resume", 
-                                    selected_item['resume'], 
-                                    file_name=f"resume_{selected_item['candidate_name']}.md",
-                                    mime="text/markdown"):
-                    st.success("Resume downloaded!")
-        else:
-            st.info("No resume history found. Generate some resumes first!")
-    
-    with history_tab2:
-        if st.session_state.email_history:
-            email_options = [f"{item['job_title']} at {item['company']} - {item['timestamp']}" for item in st.session_state.email_history]
-            selected_email = st.selectbox("Select from previous emails:", email_options)
-            
-            if selected_email:
-                selected_email_item = st.session_state.email_history[email_options.index(selected_email)]
-                st.markdown("### Previous Cold Email")
-                st.markdown(selected_email_item['email'])
-                
-                if st.download_button("📥 Download Previous Email", 
-                                    selected_email_item['email'], 
-                                    file_name=f"cold_email_{selected_email_item['sender_name']}.txt",
-                                    mime="text/plain"):
-                    st.success("Email downloaded!")
-        else:
-            st.info("No email history found. Generate some cold emails first!")
+    render_history()
 
-# Action selection - NEW FEATURE
-if selected_job_info:
+@st.fragment
+def render_generation(selected_job_info):
+    """Action choice, profile form and the generated resume or email for the selected job"""
     st.header("🎯 Choose Your Action")
     action_choice = st.radio(
         "What would you like to generate?",
@@ -414,69 +1138,65 @@ if selected_job_info:
         if not all(required_fields):
             st.error("❌ Please fill in all required fields (marked with *)")
         else:
+            # Prompt sections shared by the resume and the email, built once per submission
+            job_lines = [
+                "JOB INFORMATION:",
+                f"- Title: {selected_job_info['title']}",
+                f"- Company: {selected_job_info['company']}",
+                f"- Location: {selected_job_info['location']}",
+                "",
+                "JOB DESCRIPTION CONTEXT:",
+            ]
+            candidate_lines = [
+                "CANDIDATE PROFILE:",
+                f"- Name: {name}",
+                f"- Email: {email}",
+                f"- Phone: {phone}",
+                f"- Location: {location}",
+                f"- LinkedIn: {linkedin_profile}",
+                f"- Current Role: {current_role}",
+                f"- Experience: {experience_years} years",
+            ]
+            
             if action_choice == "📄 Generate Tailored Resume":
                 # Generate resume (existing functionality)
                 with st.spinner("🤖 Generating your tailored resume..."):
                     
-                    resume_prompt = f"""
-You are an expert resume writer and career coach. Create a highly tailored, professional resume based on the job requirements and candidate profile.
-
-JOB INFORMATION:
-- Title: {selected_job_info['title']}
-- Company: {selected_job_info['company']}
-- Location: {selected_job_info['location']}
-
-CANDIDATE PROFILE:
-- Name: {name}
-- Email: {email}
-- Phone: {phone}
-- Location: {location}
-- LinkedIn: {linkedin_profile}
-- Current Role: {current_role}
-- Experience: {experience_years} years
-- Summary: {summary}
-- Skills: {skills}
-- Experience: {experience}
-- Education: {education}
-
-CUSTOMIZATION REQUIREMENTS:
-- Style: {resume_style}
-- Length: {resume_length}
-- Focus Areas: {', '.join(focus_areas) if focus_areas else 'General'}
-- ATS Optimization: {include_keywords}
-
-JOB DESCRIPTION CONTEXT:
-{selected_job_info['raw_text'][:6000]}
-
-INSTRUCTIONS:
-1. Create a compelling, well-structured resume in markdown format
-2. Tailor content specifically to match the job requirements
-3. {'Include relevant keywords naturally throughout the resume' if include_keywords else 'Focus on clear, professional language'}
-4. Emphasize {', '.join(focus_areas) if focus_areas else 'relevant skills and experience'}
-5. Use strong action verbs and quantify achievements where possible
-6. Format should be clean and {resume_style.lower()}
-7. Target length: {resume_length}
-
-Provide a complete, ready-to-use resume that will help this candidate stand out for this specific role.
-"""
+                    resume_prompt = "\n".join([
+                        *job_lines,
+                        selected_job_info['raw_text'],
+                        "",
+                        *candidate_lines,
+                        f"- Summary: {summary}",
+                        f"- Skills: {skills}",
+                        f"- Experience: {experience}",
+                        f"- Education: {education}",
+                        "",
+                        "CUSTOMIZATION REQUIREMENTS:",
+                        f"- Style: {resume_style} (keep the format clean and {resume_style.lower()})",
+                        f"- Length: {resume_length}",
+                        f"- Focus Areas: emphasize {', '.join(focus_areas) if focus_areas else 'relevant skills and experience'}",
+                        f"- ATS Optimization: {'Include relevant keywords naturally throughout the resume' if include_keywords else 'Focus on clear, professional language'}",
+                    ])
                     
-                    ai_resume = call_ai_api(resume_prompt, "resume_generation")
+                    # Stream the resume so the first tokens render while the rest is generated
+                    st.markdown("### 📄 Your Tailored Resume")
+                    ai_resume = write_ai_stream(
+                        resume_prompt, "resume_generation", RESUME_SYSTEM_PROMPT,
+                        options=(resume_style, resume_length, sorted(focus_areas), include_keywords))
                     
                     if ai_resume:
-                        # Display resume
                         st.success("✅ Resume generated successfully!")
-                        st.markdown("### 📄 Your Tailored Resume")
-                        st.markdown(ai_resume)
                         
                         # Save to history
                         resume_entry = {
                             'candidate_name': name,
                             'job_title': selected_job_info['title'],
                             'company': selected_job_info['company'],
-                            'resume': ai_resume,
+                            'resume_path': save_history_text(ai_resume, ".md"),
                             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M')
                         }
-                        st.session_state.resume_history.append(resume_entry)
+                        append_history(st.session_state.resume_history, resume_entry, 'resume_path')
                         
                         # Download options
                         col5, col6, col7 = st.columns(3)
@@ -491,9 +1211,7 @@ Provide a complete, ready-to-use resume that will help this candidate stand out
                         
                         with col7:
                             # Generate clean text version
-                            clean_text = re.sub(r'\*\*([^*]+)\*\*', r'\1', ai_resume)
-                            clean_text = re.sub(r'\*([^*]+)\*', r'\1', clean_text)
-                            clean_text = re.sub(r'^#+\s*', '', clean_text, flags=re.MULTILINE)
+                            clean_text = strip_markdown(ai_resume)
                             
                             st.download_button(
                                 "📝 Download as Text",
@@ -514,9 +1232,7 @@ Provide a complete, ready-to-use resume that will help this candidate stand out
                             
                             with analysis_col2:
                                 # Simple keyword matching
-                                job_keywords = set(selected_job_info['raw_text'].lower().split())
-                                resume_keywords = set(ai_resume.lower().split())
-                                common_keywords = len(job_keywords.intersection(resume_keywords))
+                                common_keywords = len(selected_job_info['raw_keywords'] & keyword_set(ai_resume))
                                 
                                 st.metric("Keyword Matches", common_keywords)
                                 st.metric("Estimated Read Time", f"{word_count // 200 + 1} min")
@@ -524,91 +1240,69 @@ Provide a complete, ready-to-use resume that will help this candidate stand out
             else:  # Generate Cold Email
                 with st.spinner("🤖 Generating your cold email..."):
                     
-                    # First, extract HR information
-                    hr_info = extract_hr_info(selected_job_info['raw_text'])
+                    # HR details were extracted together with the job summary, except for jobs read from JSON-LD
+                    if not selected_job_info.get('hr_checked', True):
+                        contacts = summarize_jobs([selected_job_info['raw_text']])[0]
+                        # An empty summary is a failed call, so the job stays unchecked and is retried next time
+                        if contacts:
+                            contacts = {field: contacts.get(field) or "" for field in HR_FIELDS}
+                            selected_job_info.update(contacts, hr_checked=True)
+                            if use_cache:
+                                store_job_contacts(selected_job_info['link'], contacts)
+                    hr_info = format_hr_info(selected_job_info)
                     
                     # Generate cold email
-                    email_prompt = f"""
-You are an expert career coach and cold email specialist. Create a compelling, personalized cold email for a job opportunity.
-
-JOB INFORMATION:
-- Title: {selected_job_info['title']}
-- Company: {selected_job_info['company']}
-- Location: {selected_job_info['location']}
-
-CANDIDATE PROFILE:
-- Name: {name}
-- Email: {email}
-- Phone: {phone}
-- Location: {location}
-- LinkedIn: {linkedin_profile}
-- Current Role: {current_role}
-- Experience: {experience_years} years
-- Key Achievements: {key_achievements}
-- Motivation: {motivation}
-- Value Proposition: {value_proposition}
-
-EMAIL REQUIREMENTS:
-- Tone: {email_tone}
-- Length: {email_length}
-- Include Resume Mention: {include_attachments}
-- Request Meeting: {request_meeting}
-
-HR/CONTACT INFORMATION FOUND:
-{hr_info}
-
-JOB DESCRIPTION CONTEXT:
-{selected_job_info['raw_text'][:4000]}
-
-INSTRUCTIONS:
-1. Create a compelling cold email that stands out
-2. Address it to the appropriate person (use HR info or generic "Hiring Manager")
-3. Make it personal and specific to this company and role
-4. Highlight relevant achievements and value proposition
-5. Use a {email_tone.lower()} tone throughout
-6. Keep it {email_length.lower()} length
-7. Include a clear call-to-action
-8. {'Mention attached resume' if include_attachments else 'Do not mention attachments'}
-9. {'Request an informational meeting or call' if request_meeting else 'Focus on expressing interest'}
-10. Make the subject line compelling and specific
-
-Format:
-Subject: [Compelling subject line]
-
-[Email body]
-
-Best regards,
-{name}
-{email}
-{phone if phone else ''}
-{linkedin_profile if linkedin_profile else ''}
-"""
+                    email_prompt = "\n".join([
+                        *job_lines,
+                        truncate_tokens(selected_job_info['raw_text'], 1000),
+                        "",
+                        "HR/CONTACT INFORMATION FOUND:",
+                        hr_info,
+                        "",
+                        *candidate_lines,
+                        f"- Key Achievements: {key_achievements}",
+                        f"- Motivation: {motivation}",
+                        f"- Value Proposition: {value_proposition}",
+                        "",
+                        "EMAIL REQUIREMENTS:",
+                        f"- Tone: use a {email_tone.lower()} tone throughout",
+                        f"- Length: keep it {email_length.lower()} length",
+                        f"- Resume: {'Mention attached resume' if include_attachments else 'Do not mention attachments'}",
+                        f"- Meeting: {'Request an informational meeting or call' if request_meeting else 'Focus on expressing interest'}",
+                        "",
+                        "SIGNATURE:",
+                        "Best regards,",
+                        name,
+                        email,
+                        *[line for line in (phone, linkedin_profile) if line],
+                    ])
+                    
+                    st.markdown("### 📧 Your Cold Email")
+                    
+                    # Display HR info if found
+                    if selected_job_info.get('hr_contact'):
+                        with st.expander("👥 HR Contact Information Found", expanded=True):
+                            st.markdown(hr_info)
                     
-                    ai_email = call_ai_api(email_prompt, "email_generation")
+                    # Stream the email so the first tokens render while the rest is generated
+                    st.markdown("### Email Content:")
+                    ai_email = write_ai_stream(
+                        email_prompt, "email_generation", EMAIL_SYSTEM_PROMPT,
+                        options=(email_tone, email_length, include_attachments, request_meeting))
                     
                     if ai_email:
-                        # Display email
                         st.success("✅ Cold email generated successfully!")
-                        st.markdown("### 📧 Your Cold Email")
-                        
-                        # Display HR info if found
-                        if hr_info and "not specified" not in hr_info.lower():
-                            with st.expander("👥 HR Contact Information Found", expanded=True):
-                                st.markdown(hr_info)
-                        
-                        st.markdown("### Email Content:")
-                        st.markdown(ai_email)
                         
                         # Save to email history
                         email_entry = {
                             'sender_name': name,
                             'job_title': selected_job_info['title'],
                             'company': selected_job_info['company'],
-                            'email': ai_email,
+                            'email_path': save_history_text(ai_email, ".txt"),
                             'hr_info': hr_info,
                             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M')
                         }
-                        st.session_state.email_history.append(email_entry)
+                        append_history(st.session_state.email_history, email_entry, 'email_path')
                         
                         # Download and copy options
                         col8, col9, col10 = st.columns(3)
@@ -623,7 +1317,7 @@ Best regards,
                         
                         with col9:
                             # Extract subject line for easy copying
-                            subject_match = re.search(r'Subject:\s*(.+)', ai_email)
+                            subject_match = SUBJECT_RE.search(ai_email)
                             if subject_match:
                                 subject_line = subject_match.group(1).strip()
                                 st.text_input("📝 Subject Line (copy this):", value=subject_line)
@@ -642,7 +1336,7 @@ Best regards,
                                 st.metric("Estimated Read Time", f"{email_word_count // 200 + 1} min")
                                 
                                 # Check if email mentions company name
-                                company_mentions = ai_email.lower().count(selected_job_info['company'].lower())
+                                company_mentions = ai_email.casefold().count(selected_job_info['company'].casefold())
                                 st.metric("Company Name Mentions", company_mentions)
                         
                         # Tips for sending the email
@@ -666,25 +1360,47 @@ Best regards,
                             - Track your outreach in a spreadsheet
                             """)
 
-# Statistics and footer
-st.markdown("---")
-col11, col12, col13, col14 = st.columns(4)
-
-with col11:
-    st.metric("Resumes Generated", len(st.session_state.resume_history))
-
-with col12:
-    st.metric("Emails Generated", len(st.session_state.email_history))
+# Action selection - NEW FEATURE
+if selected_job_info:
+    render_generation(selected_job_info)
 
-with col13:
-    st.metric("Jobs Cached", len([k for k in st.session_state.job_cache.keys() if k.startswith('job_summary_')]))
+# Statistics and footer
+@st.fragment
+def render_footer_stats():
+    """Usage metrics and the Reset All Data button"""
+    col11, col12, col13, col14 = st.columns(4)
+    
+    with col14:
+        if st.button("🔄 Reset All Data"):
+            st.session_state.job_cache.clear()
+            cached_completion.clear()
+            get_generation_cache().clear()
+            get_summary_cache().clear()
+            shutil.rmtree(JOB_STORE_DIR, ignore_errors=True)
+            st.session_state.semantic_cache.clear()
+            st.session_state.resume_history.clear()
+            st.session_state.email_history.clear()
+            shutil.rmtree(st.session_state.history_dir, ignore_errors=True)
+            st.session_state.loaded_jobs.clear()
+            st.session_state.pending_batches.clear()
+            # Redraw the whole page (sidebar stats, history, loaded job), not just this fragment
+            st.session_state.data_reset = True
+            st.rerun(scope="app")
+        if st.session_state.pop('data_reset', False):
+            st.success("All data reset!")
+    
+    with col11:
+        st.metric("Resumes Generated", len(st.session_state.resume_history))
+    
+    with col12:
+        st.metric("Emails Generated", len(st.session_state.email_history))
+    
+    with col13:
+        st.metric("Jobs Cached", sum(len(entry['response']) for entry in st.session_state.job_cache.values())
+                  + len(st.session_state.loaded_jobs))
 
-with col14:
-    if st.button("🔄 Reset All Data"):
-        st.session_state.job_cache.clear()
-        st.session_state.resume_history.clear()
-        st.session_state.email_history.clear()
-        st.success("All data reset!")
+st.markdown("---")
+render_footer_stats()
 
 st.markdown("""
 <div style='text-align: center; padding: 20px; color: grey;'>